@@ -0,0 +1,290 @@
+import os
+import atexit
+import sqlite3
+import threading
+from typing import Optional
+
+from googleapiclient.errors import HttpError
+
+from .file import File, FileType
+
+
+class Cache:
+    """A local cache of the scanned Google Drive tree and of local file hashes."""
+
+    FILENAME = '.gddload_cache.sqlite'
+    FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+    def __init__(self, save_path: str) -> None:
+        """Open the cache. It is only created once something is written to it.
+
+        Args:
+            save_path (str): The path to save the files, where the cache is stored.
+        """
+        self.save_path = save_path
+        self.path = os.path.join(save_path, Cache.FILENAME)
+        self._connection = None
+
+        # the hashes are read once and written back in one transaction
+        self.hashes = {}
+        if os.path.exists(self.path):
+            self.hashes = {
+                path: (size, mtime_ns, sha256)
+                for path, size, mtime_ns, sha256 in self.connection.execute(
+                    'SELECT path, size, mtime_ns, sha256 FROM hashes'
+                )
+            }
+        self._updated_hashes = {}
+        self._hashes_lock = threading.Lock()
+        atexit.register(self.flush_hashes)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """The connection to the cache, created with its tables on first use."""
+        if self._connection is None:
+            os.makedirs(self.save_path, exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            with self._connection:
+                self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS files ('
+                    'id TEXT PRIMARY KEY, parent TEXT, name TEXT, size INTEGER, '
+                    'sha256 TEXT, mime TEXT, modified_time TEXT)'
+                )
+                self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)'
+                )
+                self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS hashes ('
+                    'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)'
+                )
+        return self._connection
+
+    def get_hash(self, path: str, stat: os.stat_result) -> Optional[str]:
+        """Get the known sha256 of a local file, if it did not change since.
+
+        Args:
+            path (str): The path of the file.
+            stat (os.stat_result): The current stat of the file.
+
+        Returns:
+            Optional[str]: The sha256 of the file, None if it is unknown.
+        """
+        with self._hashes_lock:
+            entry = self.hashes.get(os.path.abspath(path))
+        if entry is None or entry[:2] != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return entry[2]
+
+    def set_hash(self, path: str, stat: os.stat_result, sha256: str):
+        """Remember the sha256 of a local file.
+
+        Args:
+            path (str): The path of the file.
+            stat (os.stat_result): The stat of the file when it was hashed.
+            sha256 (str): The sha256 of the file.
+        """
+        path = os.path.abspath(path)
+        entry = (stat.st_size, stat.st_mtime_ns, sha256)
+        with self._hashes_lock:
+            self.hashes[path] = entry
+            self._updated_hashes[path] = entry
+
+    def flush_hashes(self):
+        """Write the new hashes to the cache."""
+        with self._hashes_lock:
+            rows = [(path, *entry) for path, entry in self._updated_hashes.items()]
+            self._updated_hashes = {}
+        if rows:
+            with self.connection:
+                self.connection.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)', rows)
+
+    @staticmethod
+    def start_page_token(root: File) -> Optional[str]:
+        """Get the current position in the Google Drive changes feed.
+
+        It must be taken before scanning, so changes made during the scan are not missed.
+
+        Args:
+            root (File): The root file, used for its configuration.
+
+        Returns:
+            Optional[str]: The page token of the changes feed, None if it is unavailable.
+        """
+        try:
+            response = root.config.service.changes().getStartPageToken().execute()
+        except HttpError as error:
+            print(f"An error occurred: {error}", flush=True)
+            return None
+        return response['startPageToken']
+
+    def load(self, root: File) -> bool:
+        """Build the file tree from the cache, refreshed with the changes since it was saved.
+
+        Args:
+            root (File): The root file to populate.
+
+        Returns:
+            bool: True if the tree was loaded, False if a full scan is needed.
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            meta = dict(self.connection.execute('SELECT key, value FROM meta'))
+            if meta.get('root') != root.id or 'page_token' not in meta:
+                return False
+
+            rows = {}
+            for id, parent, name, size, sha256, mime, modified_time in self.connection.execute(
+                'SELECT id, parent, name, size, sha256, mime, modified_time FROM files ORDER BY rowid'
+            ):
+                rows[id] = {
+                    'id': id,
+                    'parent': parent,
+                    'name': name,
+                    'size': size,
+                    'sha256Checksum': sha256,
+                    'mimeType': mime,
+                    'modifiedTime': modified_time,
+                }
+        except sqlite3.Error:
+            return False
+
+        if root.id not in rows:
+            return False
+
+        try:
+            page_token = self.apply_changes(root, rows, meta['page_token'])
+        except HttpError as error:
+            print(f"An error occurred: {error}", flush=True)
+            return False
+        if page_token is None:
+            return False
+
+        # rebuild the tree from the parent links
+        children = {}
+        for row in rows.values():
+            children.setdefault(row['parent'], []).append(row)
+
+        root.apply_metadata(rows[root.id])
+        folders = [root]
+        while folders:
+            folder = folders.pop()
+            for row in children.get(folder.id, []):
+                child = folder.child(row['id'])
+                child.apply_metadata(row)
+                if child.type == FileType.FOLDER:
+                    folders.append(child)
+
+        self.save(root, page_token)
+        return True
+
+    def apply_changes(self, root: File, rows: dict, page_token: str) -> Optional[str]:
+        """Apply the Google Drive changes since page_token to the cached rows.
+
+        Args:
+            root (File): The root file, used for its configuration.
+            rows (dict): The cached metadata by file ID, updated in place.
+            page_token (str): The page token saved with the cache.
+
+        Returns:
+            Optional[str]: The new page token, None if the cache cannot be refreshed.
+        """
+        service = root.config.service
+
+        # the IDs of the children of each folder, so removing a subtree does not scan every row
+        children = {}
+        for row in rows.values():
+            children.setdefault(row['parent'], set()).add(row['id'])
+
+        while True:
+            response = service.changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                includeRemoved=True,
+                pageSize=1000,
+                fields=f'nextPageToken, newStartPageToken, '
+                       f'changes(fileId, removed, file({File.FIELDS},parents,trashed))',
+            ).execute()
+
+            for change in response.get('changes', []):
+                id = change['fileId']
+                metadata = change.get('file')
+                if change.get('removed') or metadata is None or metadata.get('trashed'):
+                    if id == root.id:
+                        return None
+                    self.remove(rows, children, id)
+                    continue
+
+                parents = [parent for parent in metadata.get('parents', []) if parent in rows]
+                if id == root.id:
+                    metadata['parent'] = None
+                elif parents:
+                    if id not in rows and metadata['mimeType'] == Cache.FOLDER_MIME_TYPE:
+                        # the content of a folder moved into the tree is unknown
+                        return None
+                    metadata['parent'] = parents[0]
+                else:
+                    # moved out of the tree, or never in it
+                    self.remove(rows, children, id)
+                    continue
+
+                if id in rows:
+                    children[rows[id]['parent']].discard(id)
+                    rows[id].update(metadata)
+                else:
+                    rows[id] = metadata
+                children.setdefault(metadata['parent'], set()).add(id)
+
+            if 'newStartPageToken' in response:
+                return response['newStartPageToken']
+            page_token = response['nextPageToken']
+
+    @staticmethod
+    def remove(rows: dict, children: dict, id: str):
+        """Remove a file and its descendants from the cached rows.
+
+        Args:
+            rows (dict): The cached metadata by file ID, updated in place.
+            children (dict): The IDs of the children of each folder, updated in place.
+            id (str): The ID of the file to remove.
+        """
+        row = rows.get(id)
+        if row is None:
+            return
+        children[row['parent']].discard(id)
+
+        ids = [id]
+        while ids:
+            id = ids.pop()
+            rows.pop(id, None)
+            ids.extend(children.pop(id, ()))
+
+    def save(self, root: File, page_token: str):
+        """Store the file tree in the cache.
+
+        Args:
+            root (File): The root of the scanned tree.
+            page_token (str): The page token of the changes feed when the tree was scanned.
+        """
+        rows = []
+        for file in root.walk():
+            if file.type == FileType.UNKNOWN:
+                continue
+            rows.append((
+                file.id,
+                file.parent.id if file.parent is not None else None,
+                file.name,
+                file.size if file.type == FileType.FILE else 0,
+                file.sha256,
+                file.mime_type,
+                file.modified_time,
+            ))
+
+        with self.connection:
+            self.connection.execute('DELETE FROM files')
+            self.connection.executemany('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                [('root', root.id), ('page_token', page_token)],
+            )
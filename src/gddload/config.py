@@ -1,7 +1,29 @@
 import argparse
+import threading
 
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import build_http
+from googleapiclient.discovery_cache import get_static_doc
+
+
+def positive_int(value: str) -> int:
+    """Parse a strictly positive integer command line argument.
+
+    Args:
+        value (str): The argument.
+
+    Returns:
+        int: The parsed integer.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a positive integer")
+    return number
 
 
 class Config:
@@ -15,16 +37,24 @@ class Config:
             overwrite: bool,
             force: bool,
             retry: int,
+            workers: int,
+            chunk_size: int,
+            hardlink: bool,
+            rescan: bool,
     ) -> None:
         """Initialize the configuration.
 
         Args:
             file_id (str): The Google Drive file ID
             save_path (str): The path to save the files
-            check (bool): Check the sha256 of the files before and after download
+            check (bool): Check the sha256 of the files before and after download. Files without a sha256 on Google Drive are left unverified
             overwrite (bool): Overwrite the file if it already exists. If used with --check, only files that are corrupted will be overwritten
             force (bool): Force the download of the file even if it already exists
             retry (int): The number of retries in case of error. (implies --check)
+            workers (int): The number of files downloaded concurrently
+            chunk_size (int): The minimum size in bytes of each downloaded chunk
+            hardlink (bool): Hard link files identical to an already downloaded one instead of copying it
+            rescan (bool): Scan Google Drive instead of loading the tree from the cache. (implied by --force)
         """
         self.file_id = file_id
         self.save_path = save_path
@@ -32,11 +62,51 @@ class Config:
         self.overwrite = overwrite
         self.force = force
         self.retry = retry
-        self.creds = Credentials.from_service_account_file(
-            'key.json',
-            scopes=['https://www.googleapis.com/auth/drive'],
-        )
-        self.service = build("drive", "v3", credentials=self.creds)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.hardlink = hardlink
+        self.rescan = rescan or force
+        self._creds = None
+        self._discovery = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # the local cache, set once it is opened in the save path
+        self.cache = None
+
+    @property
+    def creds(self) -> Credentials:
+        """The service account credentials, loaded on first use."""
+        with self._lock:
+            if self._creds is None:
+                self._creds = Credentials.from_service_account_file(
+                    'key.json',
+                    scopes=['https://www.googleapis.com/auth/drive'],
+                )
+            return self._creds
+
+    @property
+    def discovery(self) -> str:
+        """The Drive discovery document shipped with googleapiclient, loaded once for all threads."""
+        with self._lock:
+            if self._discovery is None:
+                self._discovery = get_static_doc("drive", "v3")
+            return self._discovery
+
+    @property
+    def service(self):
+        """The Google Drive service of the current thread.
+
+        The underlying http object is not thread-safe, so each thread gets
+        its own service, built on first use. It keeps its connections alive
+        across requests, so a thread only opens a connection once.
+        """
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            # build_http sets googleapiclient's default timeout and redirect handling
+            http = AuthorizedHttp(self.creds, http=build_http())
+            service = build_from_document(self.discovery, http=http)
+            self._local.service = service
+        return service
 
     @staticmethod
     def parse_args() -> 'Config':
@@ -45,17 +115,28 @@ class Config:
         Returns:
             Config: The configuration of the program
         """
-        parser = argparse.ArgumentParser(description='Download files from Google Drive')
+        parser = argparse.ArgumentParser(
+            description='Download files from Google Drive',
+            epilog='The scanned tree and the sha256 of the local files are cached in SAVE_PATH/.gddload_cache.sqlite',
+        )
         parser.add_argument('file_id', type=str, help='The Google Drive file ID')
         parser.add_argument('--save_path', type=str, default='.', help='The path to save the files')
         parser.add_argument('--check', action='store_true',
-                            help='Check the sha256 of the files before and after download')
+                            help='Check the sha256 of the files before and after download. Files without a sha256 on Google Drive are left unverified')
         parser.add_argument('--overwrite', action='store_true',
                             help='Overwrite the file if it already exists. If used with --check, only files that are corrupted will be overwritten')
         parser.add_argument('--force', action='store_true',
                             help='Force the download of the file even if it already exists')
         parser.add_argument('--retry', type=int, default=0,
                             help='The number of retries in case of error. (implies --check)')
+        parser.add_argument('--workers', type=positive_int, default=8,
+                            help='The number of files downloaded concurrently')
+        parser.add_argument('--chunk_size', type=positive_int, default=16 * 1024 * 1024,
+                            help='The minimum size in bytes of each downloaded chunk')
+        parser.add_argument('--hardlink', action='store_true',
+                            help='Hard link files identical to an already downloaded one instead of copying it')
+        parser.add_argument('--rescan', action='store_true',
+                            help='Scan Google Drive instead of loading the tree from the cache. (implied by --force)')
         args = parser.parse_args()
 
         config = Config(
@@ -65,5 +146,9 @@ class Config:
             overwrite=args.overwrite,
             force=args.force,
             retry=args.retry,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            hardlink=args.hardlink,
+            rescan=args.rescan,
         )
         return config
@@ -1,6 +1,17 @@
+import io
 import os
+import sys
+import time
+import mmap
+import queue
+import shutil
 import hashlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 
+import httplib2
 from googleapiclient.http import MediaIoBaseDownload
 from googleapiclient.errors import HttpError
 
@@ -23,6 +34,98 @@ class ANSI:
     WHITE = '\x1b[97m'
 
 
+class HashingWriter(io.RawIOBase):
+    """A writable file wrapper computing the sha256 of the written bytes.
+
+    Writing and hashing run on a background thread, so they overlap with the
+    download of the next chunk.
+    """
+
+    def __init__(self, f, max_queued: int, hashing: bool = True) -> None:
+        """Initialize the writer.
+
+        Args:
+            f: The underlying writable file.
+            max_queued (int): The number of bytes that can wait to be written, a
+                larger write still goes through once the queue is empty.
+            hashing (bool): Compute the sha256, only write the data otherwise.
+        """
+        super().__init__()
+        self._f = f
+        self._sha256 = hashlib.sha256() if hashing else None
+        self._queue = queue.Queue()
+        self._max_queued = max_queued
+        self._queued = 0
+        self._queued_changed = threading.Condition()
+        self._error = None
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def _consume(self):
+        """Write and hash the queued chunks until the end marker."""
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            if self._error is None:
+                try:
+                    # a raw file may write only part of the data
+                    view = memoryview(data)
+                    while view:
+                        view = view[self._f.write(view):]
+                    if self._sha256 is not None:
+                        self._sha256.update(data)
+                except Exception as error:
+                    self._error = error
+            with self._queued_changed:
+                self._queued -= len(data)
+                self._queued_changed.notify()
+
+    def write(self, data: bytes) -> int:
+        """Queue data to be written to the file and fed to the hash.
+
+        Args:
+            data (bytes): The data to write.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        if self._error is not None:
+            raise self._error
+        # the caller may reuse its buffer once write returns
+        data = bytes(data)
+        with self._queued_changed:
+            # bound the memory held by each download
+            while self._queued and self._queued + len(data) > self._max_queued:
+                self._queued_changed.wait()
+            self._queued += len(data)
+        self._queue.put(data)
+        return len(data)
+
+    def close(self):
+        """Wait until all the queued data is written, the underlying file stays open."""
+        if self.closed:
+            return
+        super().close()
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def hexdigest(self) -> str:
+        """Return the sha256 of the bytes written so far.
+
+        Returns:
+            str: The hexadecimal sha256 digest, empty if not hashing.
+        """
+        if self._sha256 is None:
+            return ''
+        return self._sha256.hexdigest()
+
+
 class FileStatus:
     """The status of a file."""
 
@@ -32,10 +135,12 @@ class FileStatus:
     ALREADY_CHECKED = 3
     DOWNLOADED = 4
     CHECKED = 5
-    DOWNLOADING = 6
-    ALREADY_PRESENT = 7
-    CORRUPTED = 8
-    FAILED = 9
+    UNVERIFIED = 6
+    DOWNLOADING = 7
+    ALREADY_PRESENT = 8
+    CORRUPTED = 9
+    FAILED = 10
+    COUNT = 11  # the number of statuses
 
     @staticmethod
     def ansify(status: int) -> str:
@@ -47,28 +152,9 @@ class FileStatus:
         Returns:
             str: The ANSI escape code.
         """
-        if status == FileStatus.PENDING:
-            return ANSI.CYAN
-        elif status == FileStatus.DOWNLOADING:
-            return ANSI.BLUE
-        elif status == FileStatus.DOWNLOADED:
-            return ANSI.GREEN
-        elif status == FileStatus.ALREADY_PRESENT:
-            return ANSI.YELLOW
-        elif status == FileStatus.CORRUPTED:
-            return ANSI.RED
-        elif status == FileStatus.FAILED:
-            return ANSI.RED
-        elif status == FileStatus.CHECKED:
-            return ANSI.GREEN
-        elif status == FileStatus.ALREADY_CHECKED:
-            return ANSI.GREEN
-        elif status == FileStatus.SCANNING:
-            return ANSI.CYAN
-        elif status == FileStatus.UNDEFINED:
-            return ANSI.GREY
-        else:
-            return ANSI.DEFAULT
+        if 0 <= status < len(_ANSI_BY_STATUS):
+            return _ANSI_BY_STATUS[status]
+        return ANSI.DEFAULT
 
     @staticmethod
     def requires_details(status: int) -> bool:
@@ -80,13 +166,40 @@ class FileStatus:
         Returns:
             bool: True if the status requires details.
         """
-        return (
-            status == FileStatus.CORRUPTED or
-            status == FileStatus.FAILED or
-            status == FileStatus.ALREADY_PRESENT or
-            status == FileStatus.DOWNLOADING or
-            status == FileStatus.SCANNING
-        )
+        return status in _DETAILED_STATUSES
+
+
+# the ANSI escape code of each status, indexed by status
+_ANSI_BY_STATUS = (
+    ANSI.GREY,  # UNDEFINED
+    ANSI.CYAN,  # SCANNING
+    ANSI.CYAN,  # PENDING
+    ANSI.GREEN,  # ALREADY_CHECKED
+    ANSI.GREEN,  # DOWNLOADED
+    ANSI.GREEN,  # CHECKED
+    ANSI.YELLOW,  # UNVERIFIED
+    ANSI.BLUE,  # DOWNLOADING
+    ANSI.YELLOW,  # ALREADY_PRESENT
+    ANSI.RED,  # CORRUPTED
+    ANSI.RED,  # FAILED
+)
+
+# the statuses of the folders whose children are shown
+_DETAILED_STATUSES = frozenset((
+    FileStatus.CORRUPTED,
+    FileStatus.FAILED,
+    FileStatus.ALREADY_PRESENT,
+    FileStatus.DOWNLOADING,
+    FileStatus.SCANNING,
+))
+
+# the statuses of the files that are fully downloaded
+_DONE_STATUSES = frozenset((
+    FileStatus.ALREADY_CHECKED,
+    FileStatus.DOWNLOADED,
+    FileStatus.CHECKED,
+))
+_FULL_PROGRESS = Progress(1)
 
 
 class FileType:
@@ -97,9 +210,106 @@ class FileType:
     FOLDER = 1
 
 
+_PRINT_LOCK = threading.Lock()
+_TREE_LOCK = threading.Lock()
+_last_draw = 0.0
+_last_lines: list[str] = []
+_scrolled = False  # the last frame was taller than the terminal
+_FRAME_BUF = io.StringIO()
+
+# a verified local copy of each downloaded content, by sha256
+_COPIES: dict[str, str] = {}
+_COPIES_LOCK = threading.Lock()
+
+# the errors of the connection itself, a new attempt may succeed
+TRANSPORT_ERRORS = (httplib2.HttpLib2Error, ConnectionError, TimeoutError)
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+RATE_LIMIT_REASONS = frozenset(('rateLimitExceeded', 'userRateLimitExceeded'))
+
+
+def is_transient(error: Exception) -> bool:
+    """Check if a failed request may succeed when sent again.
+
+    Args:
+        error (Exception): The error of the request.
+
+    Returns:
+        bool: True for rate limits, server and transport errors, False otherwise.
+    """
+    if isinstance(error, HttpError):
+        if error.resp.status in RETRY_STATUSES:
+            return True
+        details = error.error_details if isinstance(error.error_details, list) else []
+        return error.resp.status == 403 and any(
+            isinstance(detail, dict) and detail.get('reason') in RATE_LIMIT_REASONS
+            for detail in details
+        )
+    return isinstance(error, TRANSPORT_ERRORS)
+
+
+HASH_BLOCK_SIZE = 1 << 20
+MMAP_THRESHOLD = 64 << 10  # smaller files are not worth the mapping setup
+
+
+def sha256sum(path: str) -> str:
+    """Compute the sha256 of a local file without loading it in memory.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The hexadecimal sha256 digest.
+    """
+    with open(path, 'rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+        if os.fstat(f.fileno()).st_size > MMAP_THRESHOLD:
+            try:
+                # hash the page cache in place, without copying it to a buffer first
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if hasattr(mm, 'madvise'):
+                        # the pages are read once, in order
+                        mm.madvise(mmap.MADV_SEQUENTIAL)
+                    return hashlib.sha256(mm).hexdigest()
+            except (ValueError, OSError, OverflowError):
+                # files larger than the address space cannot be mapped
+                pass
+
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+
+        sha256 = hashlib.sha256()
+        buf = bytearray(HASH_BLOCK_SIZE)
+        view = memoryview(buf)
+        for size in iter(lambda: f.readinto(buf), 0):
+            sha256.update(view[:size])
+        return sha256.hexdigest()
+
+
 class File:
     """A file in Google Drive."""
 
+    FIELDS = 'id,name,mimeType,size,sha256Checksum,modifiedTime'
+    PAGE_SIZE = 1000
+    BATCH_SIZE = 100  # Google Drive accepts at most 100 calls per batch
+    SCAN_WORKERS = 16
+    SCAN_RETRIES = 5  # retries of a failed listing
+    MAX_SCAN_DELAY = 30  # seconds
+    NUM_RETRIES = 5  # retries of a chunk on rate limit and server errors
+    REFRESH_INTERVAL = 0.1  # seconds between two redraws of the tree
+    CHUNKS_PER_FILE = 64  # large files use larger chunks to stay around this count
+    MAX_CHUNK_SIZE = 32 << 20
+    QUEUED_CHUNKS = 2  # chunks of each download waiting to be written
+    MAX_RETRY_DELAY = 30  # seconds
+
+    # one instance per Drive object, slots keep large trees small
+    __slots__ = (
+        'id', 'dirname', 'config', 'name', '_path', '_label', 'mime_type', 'modified_time',
+        '_size', 'type', 'sha256', 'downloaded_sha256', '_progress', '_done', '_status',
+        '_status_counts', 'children', 'parent', '_local_names', 'error',
+    )
+
     def __init__(self, id: str, dirname: str, config: Config) -> None:
         """Initialize the file.
 
@@ -112,100 +322,248 @@ class File:
         self.dirname = dirname
         self.config = config
         self.name = ''
+        self._path = os.path.join(dirname, self.name)
+        self._label = ''
+        self.mime_type = ''
+        self.modified_time = ''
         self._size = Size(0)
         self.type = FileType.UNKNOWN
         self.sha256 = ''
+        self.downloaded_sha256 = ''
         self._progress = Progress(0)
+        self._done = 0
         self._status = FileStatus.UNDEFINED
+        # the number of children in each status, a folder takes the highest one
+        self._status_counts = [0] * FileStatus.COUNT
         self.children: list[File] = []
         self.parent = None
+        self._local_names = None
+        # the last error of the file, reported once the tree is drawn for the last time
+        self.error = None
 
     @property
     def status(self) -> int:
-        if self.type == FileType.FOLDER and len(self.children) > 0:
-            self._status = max([child.status for child in self.children])
-        elif self.type == FileType.FOLDER:
-            self._status = FileStatus.UNDEFINED
         return self._status
 
     @status.setter
     def status(self, status: int):
-        self._status = status
+        with _TREE_LOCK:
+            if self.type == FileType.FOLDER:
+                # the status of a folder only comes from its children
+                status = self.children_status()
+            self.set_status(status)
         self.update()
 
+    def children_status(self) -> int:
+        """Get the highest status of the children of the file.
+
+        Returns:
+            int: The highest status, UNDEFINED if there are no children.
+        """
+        counts = self._status_counts
+        for status in range(FileStatus.COUNT - 1, FileStatus.UNDEFINED, -1):
+            if counts[status]:
+                return status
+        return FileStatus.UNDEFINED
+
+    def set_status(self, status: int):
+        """Set the status of the file and update the status of its ancestors.
+
+        Folder statuses are maintained incrementally so reading them is O(1).
+        _TREE_LOCK must be held.
+
+        Args:
+            status (int): The new status.
+        """
+        node = self
+        while True:
+            previous = node._status
+            node._status = status
+            if node.parent is None or previous == status:
+                return
+            counts = node.parent._status_counts
+            counts[previous] -= 1
+            counts[status] += 1
+            node = node.parent
+            status = node.children_status()
+
     @property
     def size(self) -> int:
-        if self.type == FileType.FOLDER:
-            self._size.size = sum([child.size for child in self.children])
         return self._size.size
 
     @size.setter
     def size(self, size: int):
-        self._size.size = size
+        self.add_totals(size=size - self._size.size)
 
     @property
     def progress(self) -> Progress:
         if self.size == 0:
             self._progress.progress = 1
-        elif self.type == FileType.FOLDER:
-            self._progress.progress = sum([child.progress.progress * child.size for child in self.children]) / self.size
+        else:
+            self._progress.progress = self._done / self.size
 
         return self._progress
 
     @progress.setter
     def progress(self, progress: float):
-        self._progress.progress = progress
+        self.add_totals(done=int(progress * self.size) - self._done)
         self.update()
 
+    def add_totals(self, size: int = 0, done: int = 0):
+        """Add to the size and downloaded bytes of the file and its ancestors.
+
+        Folder totals are maintained incrementally so reading them is O(1).
+
+        Args:
+            size (int): The size to add in bytes.
+            done (int): The downloaded bytes to add.
+        """
+        with _TREE_LOCK:
+            node = self
+            while node is not None:
+                # setting the size drops its cached text, progress ticks leave it alone
+                if size:
+                    node._size.size += size
+                node._done += done
+                node = node.parent
+
     @property
     def path(self) -> str:
-        return os.path.join(self.dirname, self.name)
+        return self._path
+
+    def local_names(self) -> set[str]:
+        """Return the names of the entries of the local folder.
+
+        The folder is listed once, so its children do not each need a stat.
+
+        Returns:
+            set[str]: The names of the entries, empty if the folder does not exist.
+        """
+        if self._local_names is None:
+            try:
+                with os.scandir(self.path) as entries:
+                    self._local_names = {entry.name for entry in entries}
+            except OSError:
+                # missing or unreadable, its files are downloaded and fail there if they cannot be written
+                self._local_names = set()
+        return self._local_names
+
+    def exists(self) -> bool:
+        """Check if the file is already present locally.
+
+        Returns:
+            bool: True if the file exists, False otherwise.
+        """
+        if self.parent is None:
+            return os.path.exists(self.path)
+        return self.name in self.parent.local_names()
+
+    def update(self, force: bool = False):
+        """Redraw the file tree, at most once per REFRESH_INTERVAL.
+
+        Args:
+            force (bool): Redraw even if the last frame is too recent.
+        """
+        global _last_draw, _last_lines, _scrolled
 
-    def update(self):
         if self.parent is not None:
-            self.parent.update()
-        else:
-            print('\x1b[0;0H\x1b[J', end='', flush=True)
-            print(self.__str__(), flush=True)
+            self.parent.update(force)
+            return
+
+        with _PRINT_LOCK:
+            now = time.monotonic()
+            if not force and now - _last_draw < File.REFRESH_INTERVAL:
+                return
+            _last_draw = now
+
+            lines = []
+            self._render(lines)
+            _FRAME_BUF.seek(0)
+            _FRAME_BUF.truncate()
+
+            # with autowrap off, lines wider than the terminal are cut instead of spilling
+            # onto the next row, so each line takes exactly one row
+            if len(lines) >= shutil.get_terminal_size().lines:
+                # the cursor cannot be moved below the last row, print the whole tree and let it scroll
+                if _scrolled and lines == _last_lines:
+                    return
+                _FRAME_BUF.write('\x1b[H\x1b[2J')
+                _FRAME_BUF.write('\n'.join(lines))
+                _FRAME_BUF.write('\n')
+                _scrolled = True
+            else:
+                # build the frame in the reused buffer, only rewriting the lines that changed
+                last_lines = _last_lines
+                if _scrolled:
+                    # the screen no longer matches the last frame
+                    _FRAME_BUF.write('\x1b[H\x1b[2J')
+                    last_lines = []
+                    _scrolled = False
+                for row, line in enumerate(lines):
+                    if row >= len(last_lines) or last_lines[row] != line:
+                        _FRAME_BUF.write(f'\x1b[{row + 1};1H{line}\x1b[K')
+                if len(lines) < len(last_lines):
+                    _FRAME_BUF.write(f'\x1b[{len(lines) + 1};1H\x1b[J')
+                if not _FRAME_BUF.tell():
+                    # nothing changed since the last frame
+                    return
+                _FRAME_BUF.write(f'\x1b[{len(lines) + 1};1H')
+            _last_lines = lines
+
+            # emit the frame with a single write
+            sys.stdout.write(f'\x1b[?7l{_FRAME_BUF.getvalue()}\x1b[?7h')
+            sys.stdout.flush()
 
     def child(self, id: str) -> 'File':
         child = File(id, self.path, self.config)
-        self.children.append(child)
-        child.parent = self
+        with _TREE_LOCK:
+            self.children.append(child)
+            child.parent = self
+            # an UNDEFINED child never raises the status of its folder
+            self._status_counts[child._status] += 1
         return child
 
     def __str__(self):
         """Return file tree as a string."""
-        if self.type == FileType.FILE:
-            color = FileStatus.ansify(self.status)
-            text = color + f"{self.name} - {self._size} {self.progress}" + ANSI.DEFAULT
-            return text
-        elif self.type == FileType.FOLDER:
-            color = FileStatus.ansify(self.status)
-            text = color + f"{self.name}/ - {self._size} {self.progress}" + ANSI.DEFAULT
-            if FileStatus.requires_details(self.status):
-                for child_i, child in enumerate(self.children):
-                    # add the child text
-                    child_text = child.__str__()
-                    child_lines = child_text.split('\n')
-                    for line_i, line in enumerate(child_lines):
-                        # add the child text with the correct indentation
-                        if child_i == len(self.children) - 1:
-                            if line_i == 0:
-                                indent = '\n└ '
-                            else:
-                                indent = '\n  '
-                        else:
-                            if line_i == 0:
-                                indent = '\n├ '
-                            else:
-                                indent = '\n│ '
-                        text += indent + line
+        lines = []
+        self._render(lines)
+        return '\n'.join(lines)
+
+    def _render(self, out: list):
+        """Append the lines of the file tree to out.
+
+        The tree is walked with an explicit stack, so deep trees cannot exceed the recursion limit.
+
+        Args:
+            out (list): The lines rendered so far.
+        """
+        # each entry is a file, the indentation of its line and the indentation of its children lines
+        stack = [(self, '', '')]
+        while stack:
+            file, prefix, child_prefix = stack.pop()
+            if file.type == FileType.UNKNOWN:
+                out.append(f"{prefix}Unknown file {file.id}")
+                continue
+
+            status = file.status
+            color = FileStatus.ansify(status)
+            # the progress of a finished file is always full, no need to compute it
+            if file.type == FileType.FILE and status in _DONE_STATUSES:
+                progress = _FULL_PROGRESS
             else:
-                text += ' ...'
-            return text
-        elif self.type == FileType.UNKNOWN:
-            return f"Unknown file {self.id}"
+                progress = file.progress
+            line = f"{prefix}{color}{file._label}{file._size} {progress}{ANSI.DEFAULT}"
+            if file.type == FileType.FOLDER and not FileStatus.requires_details(status):
+                out.append(line + ' ...')
+                continue
+            out.append(line)
+
+            if file.type == FileType.FOLDER and file.children:
+                # pushed in reverse so the children are rendered in order
+                last = file.children[-1]
+                stack.append((last, child_prefix + '└ ', child_prefix + '  '))
+                for child in reversed(file.children[:-1]):
+                    stack.append((child, child_prefix + '├ ', child_prefix + '│ '))
 
     def should_download(self) -> bool:
         """Check if the file should be downloaded.
@@ -224,43 +582,142 @@ class File:
         if self.status == FileStatus.CORRUPTED or self.status == FileStatus.ALREADY_PRESENT:
             return self.config.overwrite
 
-        if self.status == FileStatus.ALREADY_CHECKED:
+        if self.status == FileStatus.ALREADY_CHECKED or self.status == FileStatus.UNVERIFIED:
             return False
 
         raise Exception(f'Unexpected status {self.status}')
 
+    def chunk_size(self) -> int:
+        """Get the size of the chunks to download the file with.
+
+        Large files are downloaded in larger chunks, up to MAX_CHUNK_SIZE, so
+        they take fewer requests. Chunks are never smaller than the configured size.
+
+        Returns:
+            int: The chunk size in bytes.
+        """
+        return max(self.config.chunk_size, min(self.size // File.CHUNKS_PER_FILE, File.MAX_CHUNK_SIZE))
+
     def download(self):
         """Download a file from Google Drive."""
         self.status = FileStatus.DOWNLOADING
 
         request = self.config.service.files().get_media(fileId=self.id)
-        with open(self.path, 'wb') as f:
-            downloader = MediaIoBaseDownload(f, request)
-
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                self.progress = status.progress()
+        try:
+            # the chunks are large, buffering them again before writing them is useless
+            with io.FileIO(self.path, 'wb') as f:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                if hasattr(os, 'posix_fallocate') and self.size > 0:
+                    try:
+                        # reserve the whole file at once, so it is laid out contiguously
+                        os.posix_fallocate(f.fileno(), 0, self.size)
+                    except OSError:
+                        # not supported by every filesystem
+                        pass
+
+                chunk_size = self.chunk_size()
+                # without a reference sha256 there is nothing to compare the hash with
+                with HashingWriter(f, File.QUEUED_CHUNKS * chunk_size, hashing=bool(self.sha256)) as writer:
+                    downloader = MediaIoBaseDownload(writer, request, chunksize=chunk_size)
+                    # compressing the media on the fly only costs CPU on both ends, the
+                    # downloader drops this header from the request so it is set here
+                    downloader._headers['accept-encoding'] = 'identity'
+
+                    done = False
+                    while not done:
+                        status, done = downloader.next_chunk(num_retries=File.NUM_RETRIES)
+                        self.progress = status.progress()
+
+                # drop the reserved space the download did not fill
+                f.truncate()
+
+                # the file was hashed while written, its pages will not be read again soon
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        except BaseException:
+            # a partial file, with a zero filled reserved tail, would be taken for a complete one
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            raise
+
+        self.downloaded_sha256 = writer.hexdigest()
 
         self.status = FileStatus.DOWNLOADED
 
     def download_file(self):
         """Download a file from Google Drive."""
+        assert self.type == FileType.FILE
+
+        # the parent folder may not be created yet when downloading during the scan
+        os.makedirs(self.dirname, exist_ok=True)
+
+        if self.status == FileStatus.ALREADY_PRESENT and not self.config.force and self.config.check:
+            self.precheck_file()
+
         if self.should_download():
+            if self.copy_duplicate():
+                self.update(force=True)
+                return
+
             self.status = FileStatus.DOWNLOADING
-            if self.config.check:
-                self.download_with_retry(self.config.retry)
+            self.download_with_retry(self.config.retry)
+
+            if self.downloaded_sha256 == self.sha256:
+                self.register_copy()
+
+            # always show the final state of a download, even if the last frames were skipped
+            self.update(force=True)
+
+    def register_copy(self):
+        """Make the local file available to the files with the same content."""
+        if self.sha256:
+            with _COPIES_LOCK:
+                _COPIES.setdefault(self.sha256, self.path)
+
+    def copy_duplicate(self) -> bool:
+        """Create the file from an identical local file instead of downloading it.
+
+        Returns:
+            bool: True if the file was created, False if it must be downloaded.
+        """
+        if not self.sha256:
+            return False
+        with _COPIES_LOCK:
+            source = _COPIES.get(self.sha256)
+        if source is None or source == self.path:
+            return False
+
+        try:
+            if os.path.lexists(self.path):
+                os.remove(self.path)
+            if self.config.hardlink:
+                try:
+                    os.link(source, self.path)
+                except OSError:
+                    # cross-device or no hard link support
+                    shutil.copyfile(source, self.path)
             else:
-                self.download()
+                shutil.copyfile(source, self.path)
+        except OSError:
+            return False
+
+        self.downloaded_sha256 = self.sha256
+        self.remember_hash(self.sha256)
+        self.status = FileStatus.CHECKED if self.config.check else FileStatus.DOWNLOADED
+        self.progress = 1
+        return True
 
     def download_with_check(self) -> bool:
-        """Download a file from Google Drive. Check the integrity of the file.
+        """Download a file from Google Drive. Check the integrity of the file if asked.
 
         Returns:
             bool: True if the file is correct, False otherwise.
         """
         self.download()
-        return self.postcheck_file()
+        return not self.config.check or self.postcheck_file()
 
     def download_with_retry(self, retry: int) -> bool:
         """Download a file from Google Drive. Retry in case of error.
@@ -271,54 +728,96 @@ class File:
         Returns:
             bool: True if the file is correct, False otherwise.
         """
-        if retry == 0:
-            return self.download_with_check()
-
-        if self.download_with_check():
-            return True
-        else:
-            return self.download_with_retry(retry - 1)
+        for attempt in range(retry + 1):
+            try:
+                if self.download_with_check():
+                    self.error = None
+                    return True
+            except (HttpError, OSError) + TRANSPORT_ERRORS as error:
+                self.error = error
+                self.status = FileStatus.FAILED
+                if not is_transient(error):
+                    return False
+                # next_chunk already retried the request, back off longer before downloading again
+                if attempt < retry:
+                    time.sleep(min(2 ** attempt, File.MAX_RETRY_DELAY))
+        return False
 
     def download_folder(self):
-        """Download a folder from Google Drive."""
+        """Create a folder from Google Drive locally. Its children are downloaded separately."""
         assert self.type == FileType.FOLDER
 
-        if not os.path.exists(self.path):
-            os.makedirs(self.path)
-
-        for child in self.children:
-            child.download_recursive()
+        os.makedirs(self.path, exist_ok=True)
 
-    def download_recursive(self):
-        """Recursively download a file from Google Drive."""
+    def download_node(self):
+        """Download a file, or create a folder, without its children."""
         if self.type == FileType.FOLDER:
             self.download_folder()
         elif self.type == FileType.FILE:
             self.download_file()
 
+    def check_verifiable(self) -> bool:
+        """Check if Google Drive provides a sha256 to verify the file with.
+
+        A file without one is marked as UNVERIFIED.
+
+        Returns:
+            bool: True if the file can be verified, False otherwise.
+        """
+        if self.sha256:
+            return True
+
+        self.status = FileStatus.UNVERIFIED
+        self.progress = 1
+        return False
+
     def check_file(self) -> bool:
         """Check the integrity of a file from Google Drive.
 
+        The file must have a reference sha256.
+
         Returns:
             bool: True if the file is correct, False otherwise.
         """
-        assert os.path.exists(self.path)
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
 
-        with open(self.path, 'rb') as f:
-            sha256 = hashlib.sha256(f.read()).hexdigest()
+        sha256 = self.config.cache.get_hash(self.path, stat) if self.config.cache is not None else None
+        if sha256 is None:
+            try:
+                sha256 = sha256sum(self.path)
+            except FileNotFoundError:
+                return False
+            self.remember_hash(sha256, stat)
 
         return sha256 == self.sha256
 
+    def remember_hash(self, sha256: str, stat: Optional[os.stat_result] = None):
+        """Store the sha256 of the local file in the cache, if any.
+
+        Args:
+            sha256 (str): The sha256 of the local file.
+            stat (Optional[os.stat_result]): The stat of the file when it was hashed.
+        """
+        if self.config.cache is not None:
+            self.config.cache.set_hash(self.path, stat or os.stat(self.path), sha256)
+
     def precheck_file(self) -> bool:
         """Precheck the integrity of a file from Google Drive.
 
         Returns:
             bool: True if the file is correct, False otherwise.
         """
+        if not self.check_verifiable():
+            return True
+
         checked = self.check_file()
         if checked:
             self.status = FileStatus.ALREADY_CHECKED
             self.progress = 1
+            self.register_copy()
         else:
             self.status = FileStatus.CORRUPTED
 
@@ -327,10 +826,16 @@ class File:
     def postcheck_file(self) -> bool:
         """Postcheck the integrity of a file from Google Drive.
 
+        The sha256 was computed while downloading, so the file is not read again.
+
         Returns:
             bool: True if the file is correct, False otherwise.
         """
-        checked = self.check_file()
+        if not self.check_verifiable():
+            return True
+
+        self.remember_hash(self.downloaded_sha256)
+        checked = self.downloaded_sha256 == self.sha256
         if checked:
             self.status = FileStatus.CHECKED
             self.progress = 1
@@ -339,62 +844,182 @@ class File:
 
         return checked
 
-    def scan(self):
-        """Scan a file from Google Drive."""
+    def walk(self):
+        """Iterate over the file and all its descendants.
+
+        Yields:
+            File: The files of the tree, parents before their children.
+        """
+        files = [self]
+        while files:
+            file = files.pop()
+            yield file
+            files.extend(reversed(file.children))
+
+    def scan(self, on_scanned: Optional[Callable[['File'], None]] = None) -> bool:
+        """Scan a file from Google Drive.
+
+        The tree is walked breadth-first: each level of folders is listed with
+        batched requests, and the batches run concurrently.
+
+        Args:
+            on_scanned (Optional[Callable[[File], None]]): Called with every file
+                as soon as its metadata is known, before its children are scanned.
+
+        Returns:
+            bool: True if the whole tree was listed, False if some listing failed.
+        """
         try:
-            # get the file attributes
+            # get the root file attributes
             response = self.config.service.files().get(
                 fileId=self.id,
-                fields='id,name,mimeType,size,sha256Checksum',
+                fields=File.FIELDS,
             ).execute()
+        except (HttpError,) + TRANSPORT_ERRORS as error:
+            self.error = error
+            return False
 
-            # update the file attributes
-            self.id = response['id']
-            self.name = response['name']
-            if 'folder' in response['mimeType']:
-                self.type = FileType.FOLDER
-                self.size = 0
-            else:
-                self.type = FileType.FILE
-                self.size = int(response['size'])
-            self.children = []
-            self.sha256 = response.get('sha256Checksum', '')
-            self.status = FileStatus.SCANNING
-            self.progress = 0
-
-            if self.type == FileType.FILE:
-                if os.path.exists(self.path):
-                    self.status = FileStatus.ALREADY_PRESENT
-                    if not self.config.force and self.config.check:
-                        self.precheck_file()
-            elif self.type == FileType.FOLDER:
-                page_token = None
-                while True:
-                    # get the children files
-                    children_response = self.config.service.files().list(
-                        q=f"'{self.id}' in parents",
-                        spaces="drive",
-                        fields="nextPageToken, files(id)",
-                        pageToken=page_token,
-                    ).execute()
-                    children_files = children_response.get("files", [])
+        self.apply_metadata(response)
+        if on_scanned is not None:
+            on_scanned(self)
 
-                    # scan the children files
-                    for f in children_files:
-                        child_file = self.child(f['id'])
-                        child_file.scan()
+        complete = True
+        folders = [self] if self.type == FileType.FOLDER else []
+        with ThreadPoolExecutor(max_workers=File.SCAN_WORKERS) as executor:
+            while folders:
+                batches = [
+                    folders[i:i + File.BATCH_SIZE]
+                    for i in range(0, len(folders), File.BATCH_SIZE)
+                ]
+                folders = []
+                for subfolders, listed in executor.map(functools.partial(File.scan_batch, on_scanned=on_scanned), batches):
+                    folders.extend(subfolders)
+                    complete = complete and listed
 
-                    # break if there are no more children batch
-                    page_token = children_response.get("nextPageToken", None)
-                    if page_token is None:
-                        break
+        return complete
 
-                # update the size of the folder
-                self.size = sum([child.size for child in self.children])
+    def apply_metadata(self, metadata: dict):
+        """Update the file attributes from a Google Drive metadata response.
+
+        Args:
+            metadata (dict): The file metadata.
+        """
+        self.id = metadata['id']
+        self.name = metadata['name']
+        self._path = os.path.join(self.dirname, self.name)
+        self.mime_type = metadata['mimeType']
+        self.modified_time = metadata.get('modifiedTime', '')
+        if 'folder' in metadata['mimeType']:
+            self.type = FileType.FOLDER
+            self.size = 0
+            self._label = f"{self.name}/ - "
+        else:
+            self.type = FileType.FILE
+            self.size = int(metadata.get('size', 0))
+            self._label = f"{self.name} - "
+        self.children = []
+        self._status_counts = [0] * FileStatus.COUNT
+        self.sha256 = metadata.get('sha256Checksum', '')
+        self.status = FileStatus.SCANNING
+        self.progress = 0
+
+        if self.type == FileType.FILE:
+            if self.exists():
+                self.status = FileStatus.ALREADY_PRESENT
 
             # update the status to PENDING if status did not change
             if self.status == FileStatus.SCANNING:
                 self.status = FileStatus.PENDING
 
-        except HttpError as error:
-            print(f"An error occurred: {error}", flush=True)
+    @staticmethod
+    def scan_batch(
+            folders: list['File'],
+            on_scanned: Optional[Callable[['File'], None]] = None,
+    ) -> tuple[list['File'], bool]:
+        """List the children of folders using batched requests.
+
+        Listings failing with a transient error are retried with an exponential
+        backoff, up to SCAN_RETRIES times.
+
+        Args:
+            folders (list[File]): The folders to list, at most BATCH_SIZE.
+            on_scanned (Optional[Callable[[File], None]]): Called with every child found.
+
+        Returns:
+            tuple[list[File], bool]: The subfolders found, and False if some listing still failed.
+        """
+        service = folders[0].config.service
+        subfolders = []
+        complete = True
+
+        # each pending listing is a folder, the page to list and the number of failed attempts
+        pending = [(folder, None, 0) for folder in folders]
+        while pending:
+            next_pending = []
+
+            # the indices of the pending listings whose response was handled
+            handled = set()
+
+            def retry(folder: 'File', page_token: Optional[str], attempts: int, error: Exception):
+                nonlocal complete
+                if is_transient(error) and attempts < File.SCAN_RETRIES:
+                    next_pending.append((folder, page_token, attempts + 1))
+                else:
+                    folder.error = error
+                    complete = False
+
+            def callback(
+                    index: int,
+                    request_id: str,
+                    response: dict,
+                    error: HttpError,
+            ):
+                handled.add(index)
+                folder, page_token, attempts = pending[index]
+                if error is not None:
+                    retry(folder, page_token, attempts, error)
+                    return
+
+                # add the children files
+                for f in response.get("files", []):
+                    child_file = folder.child(f['id'])
+                    child_file.apply_metadata(f)
+                    if on_scanned is not None:
+                        on_scanned(child_file)
+                    if child_file.type == FileType.FOLDER:
+                        subfolders.append(child_file)
+
+                # list the next children batch if any
+                next_page_token = response.get("nextPageToken", None)
+                if next_page_token is not None:
+                    next_pending.append((folder, next_page_token, 0))
+
+            batch = service.new_batch_http_request()
+            for index, (folder, page_token, attempts) in enumerate(pending):
+                batch.add(
+                    service.files().list(
+                        q=f"'{folder.id}' in parents",
+                        spaces="drive",
+                        pageSize=File.PAGE_SIZE,
+                        fields=f"nextPageToken, files({File.FIELDS})",
+                        pageToken=page_token,
+                    ),
+                    callback=functools.partial(callback, index),
+                )
+
+            try:
+                batch.execute()
+            except (HttpError,) + TRANSPORT_ERRORS as error:
+                # only retry the listings whose response was not handled yet
+                for index, (folder, page_token, attempts) in enumerate(pending):
+                    if index not in handled:
+                        retry(folder, page_token, attempts, error)
+
+            # back off before retrying failed listings, they are mostly rate limited
+            attempts = max((attempts for _, _, attempts in next_pending), default=0)
+            if attempts > 0:
+                time.sleep(min(2 ** (attempts - 1), File.MAX_SCAN_DELAY))
+
+            pending = next_pending
+
+        return subfolders, complete
@@ -1,5 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .cache import Cache
 from .config import Config
-from .file import File
+from .file import File, FileType
 
 
 def main():
@@ -9,8 +12,40 @@ def main():
 
     print("\x1b[H\x1b[2J", end='', flush=True)  # clear the screen (but not the scrollback buffer, ie. ctrl+l)
     root_file = File(config.file_id, dirname=config.save_path, config=config)
-    root_file.scan()
-    root_file.download_recursive()
+    cache = Cache(config.save_path)
+    config.cache = cache
+    with ThreadPoolExecutor(max_workers=config.workers) as executor:
+        # download the files as soon as they are scanned
+        futures = []
+        complete = True
+
+        def download(file: File):
+            futures.append(executor.submit(file.download_node))
+
+        if not config.rescan and cache.load(root_file):
+            for file in root_file.walk():
+                download(file)
+        else:
+            page_token = Cache.start_page_token(root_file)
+            complete = root_file.scan(on_scanned=download)
+            root_file.update(force=True)
+            # an incomplete tree would be loaded as is by the next runs, never listing the missing folders
+            if complete and page_token is not None and root_file.type != FileType.UNKNOWN:
+                cache.save(root_file, page_token)
+
+        for future in as_completed(futures):
+            future.result()
+
+    cache.flush_hashes()
+    root_file.update(force=True)
+
+    # printed last, so the redraws do not hide them
+    for file in root_file.walk():
+        if file.error is not None:
+            name = file.path if file.type != FileType.UNKNOWN else file.id
+            print(f"An error occurred with {name}: {file.error}", flush=True)
+    if not complete and root_file.type != FileType.UNKNOWN:
+        print("Some folders could not be listed, run again to download their files", flush=True)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,17 @@
-import sys
-
-
 class Progress:
     """A progress bar."""
 
     BAR_LENGTH = 4
 
+    __slots__ = ('_progress', '_text')
+
     def __init__(self, progress: float) -> None:
         """Initialize the progress bar.
 
         Args:
             progress (float): The progress between 0 and 1.
         """
+        self._progress = None
         self.progress = progress
 
     @property
@@ -20,19 +20,44 @@ class Progress:
 
     @progress.setter
     def progress(self, progress: float):
-        if not 0 <= progress <= 1:
-            print(f"warning: progress {progress} is not between 0 and 1", flush=True, file=sys.stderr)
-            progress = max(0, min(progress, 1))
-        self._progress = progress
+        # set on every downloaded chunk, clamp without reporting
+        progress = 0 if progress < 0 else 1 if progress > 1 else progress
+        if progress != self._progress:
+            self._progress = progress
+            self._text = None
 
     def __str__(self) -> str:
         """Return the progress bar as a string.
 
+        The string is computed once and kept until the progress changes.
+
         Returns:
             str: The progress bar as a string.
         """
-        bar = '━' * int(Progress.BAR_LENGTH * self.progress) \
-            + ('╾' if self.progress * Progress.BAR_LENGTH % 1 >= 0.5 else '─') \
-            + '─' * Progress.BAR_LENGTH
-        bar = bar[:Progress.BAR_LENGTH]
-        return f"{bar} {100*self.progress:.2f}%"
+        if self._text is None:
+            if self._progress == 1:
+                self._text = _COMPLETE
+            else:
+                bar = _BARS[int(self._progress * Progress.BAR_LENGTH * 2)]
+                self._text = f"{bar} {100*self._progress:.2f}%"
+        return self._text
+
+
+def _bar(half_cells: int) -> str:
+    """Draw a progress bar.
+
+    Args:
+        half_cells (int): The number of filled half cells, between 0 and 2 * BAR_LENGTH.
+
+    Returns:
+        str: The progress bar.
+    """
+    bar = '━' * (half_cells // 2) \
+        + ('╾' if half_cells % 2 else '─') \
+        + '─' * Progress.BAR_LENGTH
+    return bar[:Progress.BAR_LENGTH]
+
+
+# every distinct progress bar, indexed by the number of filled half cells
+_BARS = tuple(_bar(half_cells) for half_cells in range(2 * Progress.BAR_LENGTH + 1))
+_COMPLETE = f"{_BARS[-1]} 100.00%"
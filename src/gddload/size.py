@@ -1,8 +1,13 @@
+import functools
+
+
 class Size:
     """A size in bytes."""
 
     UNITS = ['B', 'KB', 'MB', 'GB', 'TB', 'PB', 'EB', 'ZB', 'YB']
 
+    __slots__ = ('_size', '_text')
+
     def __init__(self, size: int) -> None:
         """Initialize the size.
 
@@ -11,15 +16,41 @@ class Size:
         """
         self.size = size
 
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @size.setter
+    def size(self, size: int):
+        self._size = size
+        self._text = None
+
     def __str__(self) -> str:
         """Return the size as a string.
 
+        The string is computed once and kept until the size changes.
+
         Returns:
             str: The size as a string.
         """
-        unit = 0
-        size = self.size
-        while size >= 1024 and unit < len(Size.UNITS) - 1:
-            size /= 1024
-            unit += 1
-        return f"{size:.2f} {Size.UNITS[unit]}"
+        if self._text is None:
+            self._text = format_size(self._size)
+        return self._text
+
+
+@functools.lru_cache(maxsize=4096)
+def format_size(size: int) -> str:
+    """Format a size in bytes with the most suitable unit.
+
+    Args:
+        size (int): The size in bytes.
+
+    Returns:
+        str: The size as a string.
+    """
+    # each unit is 2**10 times the previous one, so the bit length gives the unit directly
+    unit = min(max(int(size).bit_length() - 1, 0) // 10, len(Size.UNITS) - 1)
+    return f"{size / _DIVISORS[unit]:.2f} {Size.UNITS[unit]}"
+
+
+_DIVISORS = tuple(1 << (10 * unit) for unit in range(len(Size.UNITS)))
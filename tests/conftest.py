@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from gddload import gddload  # noqa: E402
+from gddload import file as file_module  # noqa: E402
+from gddload.config import Config  # noqa: E402
+
+FOLDER = 'application/vnd.google-apps.folder'
+
+
+class FakeRequest:
+    """A Drive API request returning a precomputed response."""
+
+    def __init__(self, response, error=None) -> None:
+        self.response = response
+        self.error = error
+
+    def execute(self):
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+class FakeBatch:
+    """A batch running its requests one after the other."""
+
+    def __init__(self) -> None:
+        self.requests = []
+
+    def add(self, request, callback):
+        self.requests.append((request, callback))
+
+    def execute(self):
+        for request_id, (request, callback) in enumerate(self.requests):
+            try:
+                callback(str(request_id), request.execute(), None)
+            except HttpError as error:
+                callback(str(request_id), None, error)
+
+
+class FakeDrive:
+    """An in-memory Google Drive with a changes feed.
+
+    Files are metadata dicts with an extra 'parent' key.
+    """
+
+    def __init__(self) -> None:
+        self.files_by_id = {}
+        self.changes_feed = []
+        self.failing = set()  # the folders whose listing fails
+
+    def add(self, id: str, parent, name: str, folder: bool = False):
+        self.files_by_id[id] = {
+            'id': id,
+            'parent': parent,
+            'name': name,
+            'mimeType': FOLDER if folder else 'application/octet-stream',
+            'size': '0' if folder else '10',
+        }
+
+    def remove(self, id: str):
+        del self.files_by_id[id]
+        self.changes_feed.append({'fileId': id, 'removed': True})
+
+    @staticmethod
+    def metadata(file: dict) -> dict:
+        return {key: value for key, value in file.items() if key != 'parent'}
+
+    # the service interface used by gddload
+
+    def files(self):
+        return self
+
+    def changes(self):
+        return FakeChanges(self)
+
+    def new_batch_http_request(self):
+        return FakeBatch()
+
+    def get(self, fileId: str, fields: str):
+        if fileId not in self.files_by_id:
+            return FakeRequest(None, HttpError(httplib2.Response({'status': 404}), b'File not found'))
+        return FakeRequest(self.metadata(self.files_by_id[fileId]))
+
+    def list(self, q: str, pageToken=None, **kwargs):
+        parent = q.split("'")[1]
+        if parent in self.failing:
+            content = json.dumps({'error': {'code': 403, 'message': 'Rate Limit Exceeded',
+                                          'errors': [{'reason': 'rateLimitExceeded'}]}})
+            error = HttpError(httplib2.Response({'status': 403}), content.encode())
+            return FakeRequest(None, error)
+        files = [self.metadata(file) for file in self.files_by_id.values() if file['parent'] == parent]
+        return FakeRequest({'files': files})
+
+
+class FakeChanges:
+    """The changes feed of a FakeDrive."""
+
+    def __init__(self, drive: FakeDrive) -> None:
+        self.drive = drive
+
+    def getStartPageToken(self):
+        return FakeRequest({'startPageToken': str(len(self.drive.changes_feed))})
+
+    def list(self, pageToken: str, **kwargs):
+        changes = self.drive.changes_feed[int(pageToken):]
+        return FakeRequest({'changes': changes, 'newStartPageToken': str(len(self.drive.changes_feed))})
+
+
+@pytest.fixture
+def drive(monkeypatch) -> FakeDrive:
+    """A fake Drive served to every thread, with no delay between retries."""
+    drive = FakeDrive()
+    monkeypatch.setattr(Config, 'service', property(lambda self: drive))
+    monkeypatch.setattr(file_module.time, 'sleep', lambda seconds: None)
+    return drive
+
+
+@pytest.fixture
+def config(tmp_path) -> Config:
+    return Config(
+        file_id='root',
+        save_path=str(tmp_path),
+        check=False,
+        overwrite=False,
+        force=False,
+        retry=0,
+        workers=2,
+        chunk_size=1024,
+        hardlink=False,
+        rescan=False,
+    )
+
+
+@pytest.fixture
+def run(monkeypatch, config):
+    """Run gddload on the fake Drive, without downloading the files."""
+    monkeypatch.setattr(Config, 'parse_args', staticmethod(lambda: config))
+    monkeypatch.setattr(file_module.File, 'download_node', lambda self: None)
+    return gddload.main
@@ -0,0 +1,62 @@
+import os
+
+from gddload.cache import Cache
+from gddload.config import Config
+from gddload.file import File
+
+
+def cached_ids(config: Config) -> set:
+    """Return the IDs of the cached tree, or None if the cache cannot be loaded."""
+    root = File(config.file_id, dirname=config.save_path, config=config)
+    if not Cache(config.save_path).load(root):
+        return None
+    return {file.id for file in root.walk()}
+
+
+def make_tree(drive):
+    """Add a root folder holding a file and a folder with a file and a subfolder."""
+    drive.add('root', None, 'root', folder=True)
+    drive.add('f1', 'root', 'f1')
+    drive.add('a', 'root', 'a', folder=True)
+    drive.add('f2', 'a', 'f2')
+    drive.add('b', 'a', 'b', folder=True)
+    drive.add('f3', 'b', 'f3')
+
+
+def test_incomplete_scan_is_not_cached(drive, config, run):
+    make_tree(drive)
+    drive.failing.add('a')
+    run()
+    assert cached_ids(config) is None
+
+    # the next run scans again and lists the folder that failed
+    drive.failing.clear()
+    run()
+    assert cached_ids(config) == {'root', 'f1', 'a', 'f2', 'b', 'f3'}
+
+
+def test_removed_folder_is_removed_from_cache(drive, config, run):
+    make_tree(drive)
+    run()
+    assert cached_ids(config) == {'root', 'f1', 'a', 'f2', 'b', 'f3'}
+
+    for id in ('f3', 'b', 'f2'):
+        del drive.files_by_id[id]
+    drive.remove('a')
+    assert cached_ids(config) == {'root', 'f1'}
+
+
+def test_failed_root_creates_no_cache(drive, config, run):
+    run()
+    assert not os.path.exists(os.path.join(config.save_path, Cache.FILENAME))
+
+
+def test_rescan_ignores_cache(drive, config, run):
+    make_tree(drive)
+    run()
+
+    # a change the feed does not report is only seen by a new scan
+    del drive.files_by_id['f1']
+    config.rescan = True
+    run()
+    assert cached_ids(config) == {'root', 'a', 'f2', 'b', 'f3'}
@@ -0,0 +1,19 @@
+import sys
+
+import pytest
+
+from gddload.config import Config
+
+
+@pytest.mark.parametrize('option', ['--workers', '--chunk_size'])
+@pytest.mark.parametrize('value', ['0', '-1', 'x'])
+def test_non_positive_values_are_rejected(monkeypatch, option, value):
+    monkeypatch.setattr(sys, 'argv', ['gddload', 'root', option, value])
+    with pytest.raises(SystemExit):
+        Config.parse_args()
+
+
+def test_positive_values_are_accepted(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['gddload', 'root', '--workers', '3', '--chunk_size', '1024'])
+    config = Config.parse_args()
+    assert (config.workers, config.chunk_size) == (3, 1024)
@@ -0,0 +1,48 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from gddload import gddload
+from gddload.config import Config
+from gddload.file import File
+
+
+@pytest.fixture
+def failing_download(monkeypatch, drive, config):
+    """Make every download fail with the returned list of errors, the first one raised first."""
+    errors = []
+
+    def download(self):
+        raise errors.pop(0)
+
+    monkeypatch.setattr(Config, 'parse_args', staticmethod(lambda: config))
+    monkeypatch.setattr(File, 'download', download)
+    drive.add('root', None, 'root', folder=True)
+    drive.add('f1', 'root', 'f1')
+    return errors
+
+
+@pytest.mark.parametrize('check', [False, True])
+def test_download_error_is_reported(failing_download, config, capsys, check):
+    config.check = check
+    failing_download.append(HttpError(httplib2.Response({'status': 404}), b'File not found'))
+    gddload.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert 'f1' in lines[-1] and 'File not found' in lines[-1]
+
+
+def test_transient_download_error_is_retried(failing_download, config, capsys):
+    config.retry = 1
+    failing_download.append(HttpError(httplib2.Response({'status': 503}), b'Unavailable'))
+    failing_download.append(HttpError(httplib2.Response({'status': 404}), b'File not found'))
+    gddload.main()
+    assert not failing_download
+    assert 'File not found' in capsys.readouterr().out
+
+
+def test_permanent_download_error_is_not_retried(failing_download, config):
+    config.retry = 1
+    failing_download.append(HttpError(httplib2.Response({'status': 404}), b'File not found'))
+    failing_download.append(HttpError(httplib2.Response({'status': 404}), b'File not found'))
+    gddload.main()
+    assert len(failing_download) == 1
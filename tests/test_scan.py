@@ -0,0 +1,15 @@
+def test_root_error_is_reported(drive, run, capsys):
+    run()
+    out = capsys.readouterr().out
+    assert 'File not found' in out
+    assert 'could not be listed' not in out
+
+
+def test_listing_error_is_reported_last(drive, run, capsys):
+    drive.add('root', None, 'root', folder=True)
+    drive.add('a', 'root', 'a', folder=True)
+    drive.failing.add('a')
+    run()
+    lines = capsys.readouterr().out.splitlines()
+    assert 'Rate Limit Exceeded' in lines[-2]
+    assert 'could not be listed' in lines[-1]
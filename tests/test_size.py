@@ -0,0 +1,40 @@
+from gddload.file import File
+from gddload.size import Size
+
+
+def test_str_is_stable():
+    size = Size(1536)
+    assert str(size) == '1.50 KB'
+    assert str(size) == '1.50 KB'
+
+    size.size = 3 << 20
+    assert str(size) == '3.00 MB'
+    assert str(size) == '3.00 MB'
+
+
+def test_str_small_and_large_sizes():
+    assert str(Size(0)) == '0.00 B'
+    assert str(Size(1023)) == '1023.00 B'
+    assert str(Size(1024)) == '1.00 KB'
+    assert str(Size(1 << 90)) == '1024.00 YB'
+
+
+def test_folder_size(config):
+    root = File('root', dirname=config.save_path, config=config)
+    folder = root.child('a')
+    first = folder.child('f1')
+    second = folder.child('f2')
+    first.size = 1024
+    second.size = 2048
+    assert str(folder._size) == '3.00 KB'
+    assert str(root._size) == '3.00 KB'
+
+    # progress ticks do not change the size
+    first.progress = 0.5
+    second.progress = 1
+    assert str(folder._size) == '3.00 KB'
+    assert root.progress.progress == (512 + 2048) / 3072
+
+    second.size = 0
+    assert str(folder._size) == '1.00 KB'
+    assert str(root._size) == '1.00 KB'